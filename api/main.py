@@ -7,6 +7,10 @@ import plotly.graph_objects as go
 import pandas as pd
 from datetime import datetime, timedelta
 from pymongo import MongoClient
+from user_settings import (
+    init_user_settings, get_user_settings, update_user_settings,
+    set_user_threshold, set_user_alerts, add_user_wallet, get_alert_subscribers
+)
 import logging
 from http import HTTPStatus
 
@@ -63,12 +67,7 @@ transactions = db["transactions"]
 users = db["users"]
 
 # User Settings
-def get_user_settings(user_id):
-    user = users.find_one({"user_id": user_id}) or {"alerts": True, "thresholds": {}, "wallets": []}
-    return user
-
-def update_user_settings(user_id, settings):
-    users.update_one({"user_id": user_id}, {"$set": settings}, upsert=True)
+init_user_settings(users, CHAT_ID)
 
 # Get Price
 def get_price(pair, contract):
@@ -195,17 +194,13 @@ async def handler(req):
             return {"statusCode": HTTPStatus.OK}
         try:
             threshold = float(args[2])
-            settings = get_user_settings(user_id)
-            settings["thresholds"]["price"] = threshold
-            update_user_settings(user_id, settings)
+            set_user_threshold(user_id, "price", threshold)
             await bot.send_message(chat_id=chat_id, text=f"Alert set for price {args[1]} {threshold}")
         except:
             await bot.send_message(chat_id=chat_id, text="Invalid format.")
     elif command.startswith("/alerts"):
         args = command.split()[1] if len(command.split()) > 1 else ""
-        settings = get_user_settings(user_id)
-        settings["alerts"] = args.lower() == "on"
-        update_user_settings(user_id, settings)
+        settings = set_user_alerts(user_id, args.lower() == "on")
         await bot.send_message(chat_id=chat_id, text=f"Alerts {'enabled' if settings['alerts'] else 'disabled'}.")
     elif command.startswith("/portfolio"):
         settings = get_user_settings(user_id)
@@ -222,9 +217,7 @@ async def handler(req):
         if not wallet or not w3.isAddress(wallet):
             await bot.send_message(chat_id=chat_id, text="Invalid wallet address.")
             return {"statusCode": HTTPStatus.OK}
-        settings = get_user_settings(user_id)
-        settings["wallets"] = settings.get("wallets", []) + [wallet]
-        update_user_settings(user_id, settings)
+        add_user_wallet(user_id, wallet)
         await bot.send_message(chat_id=chat_id, text=f"Wallet {wallet[:6]}... added.")
     elif body.get("callback_query"):
         query = body["callback_query"]
@@ -277,8 +270,8 @@ async def monitor_swaps():
                 if is_buy:
                     metrics = get_price(pair, contracts[pair])
                     usd_value = amount * metrics["price"]
-                    for user in users.find({"alerts": True}):
-                        if user.get("thresholds", {}).get("price", 0) <= metrics["price"]:
+                    for subscriber_chat_id, price_threshold in get_alert_subscribers():
+                        if price_threshold <= metrics["price"]:
                             alert = f"🔔 *{pair} Buy Alert* 📈\n" \
                                     f"Buyer: {to[:6]}...{to[-4:]}\n" \
                                     f"Amount: {amount:,.2f} {token_name}\n" \
@@ -297,7 +290,7 @@ async def monitor_swaps():
                                 "tx_hash": tx_hash
                             })
                             await bot.send_animation(
-                                chat_id=user.get("chat_id", CHAT_ID),
+                                chat_id=subscriber_chat_id,
                                 animation=BUY_GIF_URL,
                                 caption=alert,
                                 parse_mode="Markdown"
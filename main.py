@@ -9,6 +9,10 @@ import pandas as pd
 from datetime import datetime, timedelta
 import asyncio
 from pymongo import MongoClient
+from user_settings import (
+    init_user_settings, get_user_settings, update_user_settings,
+    set_user_threshold, set_user_alerts, add_user_wallet, get_alert_subscribers
+)
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -64,12 +68,7 @@ transactions = db["transactions"]
 users = db["users"]
 
 # User Settings
-def get_user_settings(user_id):
-    user = users.find_one({"user_id": user_id}) or {"alerts": True, "thresholds": {}, "wallets": []}
-    return user
-
-def update_user_settings(user_id, settings):
-    users.update_one({"user_id": user_id}, {"$set": settings}, upsert=True)
+init_user_settings(users, CHAT_ID)
 
 # Get Price
 def get_price(pair, contract):
@@ -156,8 +155,8 @@ async def monitor_swaps(updater):
                     if is_buy:
                         metrics = get_price(pair, contracts[pair])
                         usd_value = amount * metrics['price']
-                        for user in users.find({"alerts": True}):
-                            if user.get("thresholds", {}).get("price", 0) <= metrics["price"]:
+                        for chat_id, price_threshold in get_alert_subscribers():
+                            if price_threshold <= metrics["price"]:
                                 alert = f"🔔 *{pair} Buy Alert* 📈\n" \
                                         f"Buyer: {to[:6]}...{to[-4:]}\n" \
                                         f"Amount: {amount:,.2f} {token_name}\n" \
@@ -176,7 +175,7 @@ async def monitor_swaps(updater):
                                     "timestamp": datetime.now().timestamp()
                                 })
                                 updater.bot.send_animation(
-                                    chat_id=user.get("chat_id", CHAT_ID),
+                                    chat_id=chat_id,
                                     animation=BUY_GIF_URL,
                                     caption=alert,
                                     parse_mode="Markdown"
@@ -275,9 +274,7 @@ def set_alert(update, context):
         return
     try:
         threshold = float(args[2])
-        settings = get_user_settings(user_id)
-        settings["thresholds"]["price"] = threshold
-        update_user_settings(user_id, settings)
+        set_user_threshold(user_id, "price", threshold)
         update.message.reply_text(f"Alert set for price {args[1]} {threshold}")
     except:
         update.message.reply_text("Invalid format.")
@@ -285,9 +282,7 @@ def set_alert(update, context):
 def alerts(update, context):
     user_id = update.message.from_user.id
     args = context.args[0] if context.args else ""
-    settings = get_user_settings(user_id)
-    settings["alerts"] = args.lower() == "on"
-    update_user_settings(user_id, settings)
+    settings = set_user_alerts(user_id, args.lower() == "on")
     update.message.reply_text(f"Alerts {'enabled' if settings['alerts'] else 'disabled'}.")
 
 def portfolio(update, context):
@@ -312,9 +307,7 @@ def add_wallet(update, context):
     if not wallet or not w3.isAddress(wallet):
         update.message.reply_text("Invalid wallet address.")
         return
-    settings = get_user_settings(user_id)
-    settings["wallets"] = settings.get("wallets", []) + [wallet]
-    update_user_settings(user_id, settings)
+    add_user_wallet(user_id, wallet)
     update.message.reply_text(f"Wallet {wallet[:6]}... added.")
 
 # Main
@@ -0,0 +1,203 @@
+import copy
+
+import pytest
+from pymongo.errors import PyMongoError
+
+import user_settings
+
+
+def _matches(doc, query):
+    for key, value in query.items():
+        if isinstance(value, dict) and "$gte" in value:
+            if doc.get(key, float("-inf")) < value["$gte"]:
+                return False
+        elif doc.get(key) != value:
+            return False
+    return True
+
+
+def _project(doc, projection):
+    doc = copy.deepcopy(doc)
+    doc.pop("_id", None)
+    return doc
+
+
+class StubUsers:
+    """Just enough of a pymongo collection for user_settings, with hooks to simulate races."""
+
+    def __init__(self):
+        self.docs = {}
+        self.queries = 0
+        self.before_find_returns = None
+        self.before_find_one_returns = None
+        self.indexes = []
+        self.index_error = None
+
+    def create_index(self, key, unique=False):
+        if self.index_error:
+            raise self.index_error
+        self.indexes.append((key, unique))
+
+    def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=None):
+        user_id = query["user_id"]
+        doc = self.docs.get(user_id)
+        if doc is None:
+            doc = {"_id": user_id, "user_id": user_id, **copy.deepcopy(update.get("$setOnInsert", {}))}
+            self.docs[user_id] = doc
+        for path, value in update.get("$set", {}).items():
+            if "." in path:
+                field, key = path.split(".")
+                doc.setdefault(field, {})[key] = value
+            else:
+                doc[path] = copy.deepcopy(value)
+        for field, value in update.get("$addToSet", {}).items():
+            values = doc.setdefault(field, [])
+            if value not in values:
+                values.append(value)
+        for field, value in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + value
+        return _project(doc, projection)
+
+    def find_one(self, query, projection=None):
+        self.queries += 1
+        doc = self.docs.get(query["user_id"])
+        result = _project(doc, projection) if doc else None
+        if self.before_find_one_returns:
+            hook, self.before_find_one_returns = self.before_find_one_returns, None
+            hook()
+        return result
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        result = [_project(doc, projection) for doc in self.docs.values() if _matches(doc, query)]
+        if self.before_find_returns:
+            hook, self.before_find_returns = self.before_find_returns, None
+            hook()
+        return iter(result)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(user_settings.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def users(clock):
+    stub = StubUsers()
+    user_settings.init_user_settings(stub, "default-chat")
+    return stub
+
+
+def _start(user_id, chat_id):
+    user_settings.update_user_settings(user_id, {"alerts": True, "thresholds": {}, "wallets": [], "chat_id": chat_id})
+
+
+def _external_write(users, user_id, clock, **fields):
+    doc = users.docs[user_id]
+    doc.update(fields, version=doc["version"] + 1, updated_at=clock[0])
+
+
+def test_write_during_reload_survives_snapshot_swap(users, clock):
+    _start(1, "a")
+    users.before_find_returns = lambda: user_settings.set_user_alerts(1, False)
+    assert user_settings.get_alert_subscribers() == []
+
+    user_settings.set_user_alerts(1, True)
+    clock[0] += user_settings.USER_CACHE_TTL + 1
+    users.before_find_returns = lambda: user_settings.set_user_threshold(1, "price", 0.5)
+    assert user_settings.get_alert_subscribers() == [("a", 0.5)]
+
+
+def test_stale_find_one_does_not_overwrite_newer_version(users, clock):
+    user_settings.set_user_threshold(1, "price", 0.1)
+    clock[0] += user_settings.USER_CACHE_TTL + 1
+    users.before_find_one_returns = lambda: user_settings.set_user_threshold(1, "price", 0.2)
+
+    assert user_settings.get_user_settings(1)["thresholds"]["price"] == 0.2
+    queries = users.queries
+    assert user_settings.get_user_settings(1)["thresholds"]["price"] == 0.2
+    assert users.queries == queries
+    assert user_settings.get_alert_subscribers() == [("default-chat", 0.2)]
+
+
+def test_alerts_off_removes_subscriber_in_same_process(users):
+    _start(1, "a")
+    _start(2, "b")
+    assert sorted(user_settings.get_alert_subscribers()) == [("a", 0), ("b", 0)]
+
+    user_settings.set_user_alerts(1, False)
+    assert user_settings.get_alert_subscribers() == [("b", 0)]
+
+
+def test_changes_from_other_processes_invalidate_cache(users, clock):
+    _start(1, "a")
+    assert user_settings.get_alert_subscribers() == [("a", 0)]
+    assert user_settings.get_user_settings(1)["wallets"] == []
+
+    _external_write(users, 1, clock, alerts=False, wallets=["0xabc"])
+    clock[0] += user_settings.USER_SYNC_INTERVAL + 1
+
+    assert user_settings.get_alert_subscribers() == []
+    assert user_settings.get_user_settings(1)["wallets"] == ["0xabc"]
+
+
+def test_external_change_after_first_write_is_seen(users, clock):
+    user_settings.add_user_wallet(1, "0xa")
+    clock[0] += 10
+    _external_write(users, 1, clock, wallets=["0xa", "0xb"])
+    clock[0] += 90
+
+    assert user_settings.get_user_settings(1)["wallets"] == ["0xa", "0xb"]
+
+
+def test_unknown_user_is_cached(users):
+    assert user_settings.get_user_settings(1) == {"alerts": True, "thresholds": {}, "wallets": []}
+    queries = users.queries
+    user_settings.get_user_settings(1)
+    assert users.queries == queries
+
+    user_settings.add_user_wallet(1, "0xabc")
+    assert user_settings.get_user_settings(1)["wallets"] == ["0xabc"]
+
+
+def test_returned_settings_are_copies(users):
+    settings = user_settings.set_user_threshold(1, "price", 0.1)
+    settings["thresholds"]["price"] = 5
+    user_settings.get_user_settings(1)["wallets"].append("0xabc")
+
+    assert user_settings.get_user_settings(1)["thresholds"] == {"price": 0.1}
+    assert user_settings.get_user_settings(1)["wallets"] == []
+    assert user_settings.get_alert_subscribers() == [("default-chat", 0.1)]
+
+
+def test_expired_entries_are_evicted(users, clock):
+    user_settings.get_user_settings(1)
+    user_settings.set_user_alerts(2, True)
+    clock[0] += user_settings.USER_CACHE_TTL + 1
+
+    user_settings.get_alert_subscribers()
+    assert user_settings._user_cache == {}
+    assert user_settings.get_alert_subscribers() == [("default-chat", 0)]
+
+
+def test_indexes_are_created_lazily(clock):
+    stub = StubUsers()
+    user_settings.init_user_settings(stub, "default-chat")
+    assert stub.indexes == []
+
+    user_settings.get_user_settings(1)
+    assert stub.indexes == [("updated_at", False), ("user_id", True)]
+
+
+def test_index_errors_do_not_break_settings(users):
+    users.index_error = PyMongoError("unreachable")
+    user_settings.init_user_settings(users, "default-chat")
+
+    user_settings.add_user_wallet(1, "0xabc")
+    assert user_settings.get_user_settings(1)["wallets"] == ["0xabc"]
+
+    users.index_error = None
+    user_settings.get_user_settings(1)
+    assert users.indexes == [("updated_at", False), ("user_id", True)]
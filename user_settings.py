@@ -0,0 +1,174 @@
+import copy
+import logging
+import threading
+import time
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Write-through cache of user settings shared by the polling bot (main.py) and the
+# Vercel handlers (api/main.py). Every write is a field-level atomic update that
+# bumps the document's "version" and "updated_at"; the returned document replaces
+# the cached copy. Changes made by other processes are picked up by a
+# changed-since query on "updated_at", run at most every USER_SYNC_INTERVAL
+# seconds, and applied only when their version is newer than the one seen here.
+USER_CACHE_TTL = 300
+USER_SYNC_INTERVAL = 2
+USER_SYNC_OVERLAP = 30  # re-read recent changes to cover clock skew and late commits
+DEFAULT_USER_SETTINGS = {"alerts": True, "thresholds": {}, "wallets": []}
+USER_PROJECTION = {"_id": 0}
+SUBSCRIBER_PROJECTION = {"_id": 0, "user_id": 1, "alerts": 1, "chat_id": 1, "thresholds.price": 1, "version": 1}
+
+users = None
+default_chat_id = None
+
+_lock = threading.Lock()
+_user_cache = {}  # user_id -> (expires_at, settings), settings is None for unknown users
+_user_versions = {}  # user_id -> newest version seen
+_subscribers = {}  # user_id -> (chat_id, price_threshold) for users with alerts on
+_subscribers_loaded_at = 0
+_synced_at = 0
+_indexes_ready = False
+
+def init_user_settings(collection, chat_id):
+    global users, default_chat_id, _subscribers_loaded_at, _synced_at, _indexes_ready
+    users = collection
+    default_chat_id = chat_id
+    with _lock:
+        _user_cache.clear()
+        _user_versions.clear()
+        _subscribers.clear()
+        _subscribers_loaded_at = 0
+        # The cache is empty here, so every later change falls inside the first sync window
+        _synced_at = time.time()
+        _indexes_ready = False
+
+# Indexes are created on first use so importing the bot never blocks on Mongo
+def _ensure_indexes():
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    try:
+        users.create_index("updated_at")
+        try:
+            users.create_index("user_id", unique=True)
+        except PyMongoError as e:
+            # Older data may hold duplicate user documents; index without the constraint
+            logger.warning(f"Unique user_id index failed, falling back to plain index: {e}")
+            users.create_index("user_id")
+        _indexes_ready = True
+    except PyMongoError as e:
+        logger.error(f"User index error: {e}")
+
+def _default_settings():
+    return copy.deepcopy(DEFAULT_USER_SETTINGS)
+
+def _subscriber_entry(settings):
+    if not settings.get("alerts"):
+        return None
+    return settings.get("chat_id", default_chat_id), settings.get("thresholds", {}).get("price", 0)
+
+# Callers must hold _lock. Returns False when the document is older than what we've seen.
+def _apply_user(settings, cache_settings):
+    user_id = settings.get("user_id")
+    version = settings.get("version", 0)
+    previous = _user_versions.get(user_id, 0)
+    if version < previous:
+        return False
+    _user_versions[user_id] = version
+    entry = _subscriber_entry(settings)
+    if entry:
+        _subscribers[user_id] = entry
+    else:
+        _subscribers.pop(user_id, None)
+    if cache_settings:
+        _user_cache[user_id] = (time.time() + USER_CACHE_TTL, settings)
+    elif version > previous:
+        _user_cache.pop(user_id, None)
+    return True
+
+def _cache_user(user_id, settings):
+    with _lock:
+        if settings is None:
+            if user_id not in _user_versions:
+                _user_cache[user_id] = (time.time() + USER_CACHE_TTL, None)
+                return _default_settings()
+        elif _apply_user(settings, cache_settings=True):
+            return copy.deepcopy(settings)
+        cached = _user_cache.get(user_id)
+        if cached and cached[1] is not None:
+            return copy.deepcopy(cached[1])
+    return copy.deepcopy(settings) if settings is not None else _default_settings()
+
+def _sync_user_changes():
+    global _synced_at
+    _ensure_indexes()
+    now = time.time()
+    with _lock:
+        since = _synced_at
+        if now - since < USER_SYNC_INTERVAL:
+            return
+    changed = list(users.find({"updated_at": {"$gte": since - USER_SYNC_OVERLAP}}, USER_PROJECTION))
+    with _lock:
+        for user_id in [k for k, (expires_at, _) in _user_cache.items() if expires_at <= now]:
+            del _user_cache[user_id]
+        for settings in changed:
+            user_id = settings.get("user_id")
+            newer = settings.get("version", 0) > _user_versions.get(user_id, 0)
+            _apply_user(settings, cache_settings=newer and user_id in _user_cache)
+        _synced_at = max(_synced_at, now)
+
+def _write_user(user_id, update):
+    _ensure_indexes()
+    # Defaults are only written on insert, and only for fields the update leaves alone
+    touched = {path.split(".")[0] for op in update.values() for path in op}
+    defaults = {k: v for k, v in DEFAULT_USER_SETTINGS.items() if k not in touched}
+    update = {**update, "$set": {**update.get("$set", {}), "updated_at": time.time()}, "$inc": {"version": 1}}
+    if defaults:
+        update["$setOnInsert"] = defaults
+    settings = users.find_one_and_update(
+        {"user_id": user_id},
+        update,
+        projection=USER_PROJECTION,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return _cache_user(user_id, settings)
+
+# Settings are returned as copies; change them through the setters below.
+def get_user_settings(user_id):
+    _sync_user_changes()
+    with _lock:
+        cached = _user_cache.get(user_id)
+        if cached and cached[0] > time.time():
+            return copy.deepcopy(cached[1]) if cached[1] is not None else _default_settings()
+    return _cache_user(user_id, users.find_one({"user_id": user_id}, USER_PROJECTION))
+
+def update_user_settings(user_id, settings):
+    settings = {k: v for k, v in settings.items() if k not in ("_id", "version", "updated_at")}
+    return _write_user(user_id, {"$set": settings})
+
+def set_user_threshold(user_id, key, value):
+    return _write_user(user_id, {"$set": {f"thresholds.{key}": value}})
+
+def set_user_alerts(user_id, enabled):
+    return _write_user(user_id, {"$set": {"alerts": enabled}})
+
+def add_user_wallet(user_id, wallet):
+    return _write_user(user_id, {"$addToSet": {"wallets": wallet}})
+
+def get_alert_subscribers():
+    global _subscribers_loaded_at
+    _sync_user_changes()
+    started = time.time()
+    with _lock:
+        if _subscribers_loaded_at + USER_CACHE_TTL > started:
+            return list(_subscribers.values())
+    # Full reload as a backstop; versions keep writes that land meanwhile from being undone
+    loaded = list(users.find({}, SUBSCRIBER_PROJECTION))
+    with _lock:
+        for settings in loaded:
+            _apply_user(settings, cache_settings=False)
+        _subscribers_loaded_at = started
+        return list(_subscribers.values())